@@ -5,15 +5,16 @@ This file implements a simple MCP server for context management operations.
 """
 
 import os
-import json
 import logging
-import uuid
-from functools import lru_cache
-from typing import Dict, Any, List, Optional, Union
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Any, List, Optional, Tuple, Union
 
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+import orjson
+import redis.asyncio as aioredis
 import uvicorn
 
 # Configure logging
@@ -23,8 +24,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger("context7-mcp")
 
+# Get environment variables
+MAX_CTX_PER_USER = int(os.environ.get("MAX_CTX_PER_USER", "1024"))
+if MAX_CTX_PER_USER < 1:
+    # Both stores evict by trimming to the last MAX_CTX_PER_USER entries, which needs at least one
+    raise ValueError(f"MAX_CTX_PER_USER must be at least 1, got {MAX_CTX_PER_USER}")
+REDIS_URL = os.environ.get("REDIS_URL")
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+if WEB_CONCURRENCY > 1 and not REDIS_URL:
+    # In-memory contexts are per process, so each worker would see a different stack.
+    # Checked at import so it also covers the uvicorn CLI, which reads WEB_CONCURRENCY itself.
+    raise RuntimeError("WEB_CONCURRENCY > 1 requires REDIS_URL so workers share context storage")
+
 # Create FastAPI app
-app = FastAPI(title="Context7 MCP Server")
+app = FastAPI(
+    title="Context7 MCP Server",
+    default_response_class=ORJSONResponse,
+    # /openapi.json is served from precomputed bytes below;
+    # FastAPI's own schema, used by /docs and /redoc, moves aside instead of shadowing it
+    openapi_url="/fastapi-openapi.json"
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -35,9 +54,170 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@dataclass(slots=True)
+class UserCtx:
+    """Contexts stored for a single user"""
+    order: Deque[str] = field(default_factory=lambda: deque(maxlen=MAX_CTX_PER_USER))  # Context IDs in push order (stack)
+    by_id: Dict[str, Any] = field(default_factory=dict)  # Context ID -> context data
+    listing_cache: Optional[List[Dict[str, Any]]] = None  # list_contexts result, reset on push/pop
+
 # In-memory storage for contexts
-contexts = {}  # User ID -> List of contexts
-context_stacks = {}  # User ID -> List of context IDs (stack)
+users: Dict[str, UserCtx] = {}  # User ID -> UserCtx
+
+# Pre-generated context IDs, refilled from a single os.urandom call
+_ID_BATCH = 256
+_ID_BUF: Deque[str] = deque()
+
+def _next_cid(_buf: Deque[str] = _ID_BUF, _urandom: Callable[[int], bytes] = os.urandom) -> str:
+    """Return a fresh random context ID (defaults pre-bind globals as fast locals)"""
+    if not _buf:
+        raw = _urandom(4 * _ID_BATCH)
+        _buf.extend("ctx_" + raw[i:i + 4].hex() for i in range(0, len(raw), 4))
+    return _buf.popleft()
+
+class MemoryStore:
+    """Context storage in process memory; only consistent within a single worker"""
+    
+    async def push_context(self, user_id: str, context_data: Any) -> str:
+        # Initialize user contexts if not exists; setdefault keeps concurrent first pushes from
+        # replacing each other's state
+        user = users.get(user_id) or users.setdefault(user_id, UserCtx())
+        
+        # Create a new context, storing it before it becomes visible on the stack
+        context_id = _next_cid()
+        user.by_id[context_id] = context_data
+        if len(user.order) == user.order.maxlen:
+            # Evict the oldest context to stay within MAX_CTX_PER_USER
+            user.by_id.pop(user.order.popleft(), None)
+        user.order.append(context_id)
+        user.listing_cache = None
+        return context_id
+    
+    async def pop_context(self, user_id: str) -> Optional[Tuple[str, Any]]:
+        # Pop the last context; a single pop() avoids racing a separate emptiness check
+        user = users.get(user_id)
+        if user is None:
+            return None
+        try:
+            context_id = user.order.pop()
+        except IndexError:
+            return None
+        popped_context = user.by_id.pop(context_id, None)
+        user.listing_cache = None
+        return context_id, popped_context
+    
+    async def list_contexts(self, user_id: str) -> List[Dict[str, Any]]:
+        # Rebuild the listing only after the stack has changed
+        user = users.get(user_id)
+        if user is None:
+            return []
+        if user.listing_cache is None:
+            by_id = user.by_id
+            user.listing_cache = [
+                {"context_id": context_id, "context": by_id[context_id]}
+                for context_id in user.order
+            ]
+        return user.listing_cache
+    
+    async def get_context(self, user_id: str, context_id: str) -> Any:
+        user = users.get(user_id)
+        return user.by_id.get(context_id) if user is not None else None
+    
+    async def clear_contexts(self, user_id: str) -> None:
+        users.pop(user_id, None)
+    
+    async def close(self) -> None:
+        pass
+
+class RedisStore:
+    """Context storage in Redis, shared by every worker and machine
+    
+    Each user has a list ``stk:<user_id>`` of context IDs (oldest first) and a hash
+    ``ctx:<user_id>`` of context ID -> orjson-encoded context.
+    """
+    
+    # Stores the context, pushes its ID, trims the stack to the limit and deletes the
+    # evicted contexts atomically, so no evicted context stays readable
+    PUSH_SCRIPT = """
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    local limit = tonumber(ARGV[3])
+    local evicted = redis.call('LRANGE', KEYS[1], 0, -limit - 1)
+    if #evicted > 0 then
+        redis.call('LTRIM', KEYS[1], -limit, -1)
+        for _, context_id in ipairs(evicted) do
+            redis.call('HDEL', KEYS[2], context_id)
+        end
+    end
+    return #evicted
+    """
+    
+    def __init__(self, url: str):
+        # Callers wait up to 5s for a free connection instead of failing once all are in use
+        pool = aioredis.BlockingConnectionPool.from_url(
+            url, max_connections=256, timeout=5, decode_responses=False
+        )
+        self.redis = aioredis.Redis(connection_pool=pool)
+        self._push = self.redis.register_script(self.PUSH_SCRIPT)
+    
+    async def push_context(self, user_id: str, context_data: Any) -> str:
+        context_id = _next_cid()
+        await self._push(
+            keys=[f"stk:{user_id}", f"ctx:{user_id}"],
+            args=[context_id, orjson.dumps(context_data), MAX_CTX_PER_USER]
+        )
+        return context_id
+    
+    async def pop_context(self, user_id: str) -> Optional[Tuple[str, Any]]:
+        ctx_key = f"ctx:{user_id}"
+        context_id = await self.redis.rpop(f"stk:{user_id}")
+        if context_id is None:
+            return None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(ctx_key, context_id)
+            pipe.hdel(ctx_key, context_id)
+            raw, _ = await pipe.execute()
+        return context_id.decode(), orjson.loads(raw) if raw is not None else None
+    
+    async def list_contexts(self, user_id: str) -> List[Dict[str, Any]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lrange(f"stk:{user_id}", 0, -1)
+            pipe.hgetall(f"ctx:{user_id}")
+            order, by_id = await pipe.execute()
+        loads = orjson.loads
+        return [
+            {"context_id": context_id.decode(), "context": loads(by_id[context_id])}
+            for context_id in order
+            if context_id in by_id
+        ]
+    
+    async def get_context(self, user_id: str, context_id: str) -> Any:
+        raw = await self.redis.hget(f"ctx:{user_id}", context_id)
+        return orjson.loads(raw) if raw is not None else None
+    
+    async def clear_contexts(self, user_id: str) -> None:
+        await self.redis.delete(f"stk:{user_id}", f"ctx:{user_id}")
+    
+    async def close(self) -> None:
+        # A pool passed to Redis() explicitly is not closed along with it
+        await self.redis.aclose()
+        await self.redis.connection_pool.disconnect()
+
+# Active context storage; replaced with a RedisStore on startup when REDIS_URL is set
+STORE: Union[MemoryStore, RedisStore] = MemoryStore()
+
+@app.on_event("startup")
+async def startup():
+    """Select the context storage backend"""
+    global STORE
+    if REDIS_URL:
+        STORE = RedisStore(REDIS_URL)
+        logger.info("Storing contexts in Redis")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the context storage backend"""
+    await STORE.close()
 
 # Define context management functions schema for OpenAPI documentation
 CONTEXT_FUNCTIONS = {
@@ -143,138 +323,134 @@ CONTEXT_FUNCTIONS = {
     }
 }
 
+async def _push_context(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Add a new context to the user's stack"""
+    user_id = parameters.get("user_id")
+    context_data = parameters.get("context")
+    
+    if not user_id:
+        return {"error": "user_id parameter is required"}
+    
+    if not context_data:
+        return {"error": "context parameter is required"}
+    
+    context_id = await STORE.push_context(user_id, context_data)
+    
+    return {"context_id": context_id, "success": True}
+
+async def _pop_context(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove the most recent context from the user's stack"""
+    user_id = parameters.get("user_id")
+    
+    if not user_id:
+        return {"error": "user_id parameter is required"}
+    
+    popped = await STORE.pop_context(user_id)
+    if popped is None:
+        return {"error": "No contexts to pop", "success": False}
+    context_id, popped_context = popped
+    
+    return {"context_id": context_id, "context": popped_context, "success": True}
+
+async def _list_contexts(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """List all contexts in the user's stack"""
+    user_id = parameters.get("user_id")
+    
+    if not user_id:
+        return {"error": "user_id parameter is required"}
+    
+    return {"contexts": await STORE.list_contexts(user_id)}
+
+async def _get_context(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Get a specific context by ID"""
+    user_id = parameters.get("user_id")
+    context_id = parameters.get("context_id")
+    
+    if not user_id:
+        return {"error": "user_id parameter is required"}
+    
+    if not context_id:
+        return {"error": "context_id parameter is required"}
+    
+    # Check if user and context exist
+    context = await STORE.get_context(user_id, context_id)
+    if context is None:
+        return {"error": f"Context with id {context_id} not found for user {user_id}", "success": False}
+    
+    return {"context_id": context_id, "context": context, "success": True}
+
+async def _clear_contexts(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Clear all contexts from the user's stack"""
+    user_id = parameters.get("user_id")
+    
+    if not user_id:
+        return {"error": "user_id parameter is required"}
+    
+    # Clear user contexts
+    await STORE.clear_contexts(user_id)
+    
+    return {"success": True}
+
+# Function name -> handler, so dispatch is a single dict lookup
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "push_context": _push_context,
+    "pop_context": _pop_context,
+    "list_contexts": _list_contexts,
+    "get_context": _get_context,
+    "clear_contexts": _clear_contexts,
+}
+
 # MCP endpoint
+# Handlers return ready-made responses so FastAPI skips its generic response serialization
 @app.post("/mcp/{function_name}")
 async def handle_mcp_request(function_name: str, request: Request):
     """Handle MCP request"""
+    # Reject unknown functions before reading or parsing the body
+    handler = HANDLERS.get(function_name)
+    if handler is None:
+        raise HTTPException(status_code=404, detail=f"Function {function_name} not supported")
+    
     try:
         # Parse request body
         body = await request.body()
-        parameters = json.loads(body) if body else {}
+        parameters = orjson.loads(body) if body else {}
         
         # Log the request
-        logger.info(f"Received request for function: {function_name}")
-        logger.info(f"Parameters: {parameters}")
-        
-        # Handle different functions
-        if function_name == "push_context":
-            user_id = parameters.get("user_id")
-            context_data = parameters.get("context")
-            
-            if not user_id:
-                return {"error": "user_id parameter is required"}
-            
-            if not context_data:
-                return {"error": "context parameter is required"}
-            
-            # Initialize user contexts if not exists
-            if user_id not in contexts:
-                contexts[user_id] = {}
-                context_stacks[user_id] = []
-            
-            # Create a new context
-            context_id = f"ctx_{str(uuid.uuid4())[:8]}"
-            contexts[user_id][context_id] = context_data
-            context_stacks[user_id].append(context_id)
-            
-            result = {"context_id": context_id, "success": True}
-        
-        elif function_name == "pop_context":
-            user_id = parameters.get("user_id")
-            
-            if not user_id:
-                return {"error": "user_id parameter is required"}
-            
-            # Check if user has contexts
-            if user_id not in context_stacks or not context_stacks[user_id]:
-                return {"error": "No contexts to pop", "success": False}
-            
-            # Pop the last context
-            context_id = context_stacks[user_id].pop()
-            popped_context = contexts[user_id].pop(context_id, None)
-            
-            result = {"context_id": context_id, "context": popped_context, "success": True}
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Received request for function: %s", function_name)
+            logger.debug("Parameters: %s", parameters)
         
-        elif function_name == "list_contexts":
-            user_id = parameters.get("user_id")
-            
-            if not user_id:
-                return {"error": "user_id parameter is required"}
-            
-            # Get user contexts
-            user_contexts = []
-            if user_id in context_stacks:
-                for context_id in context_stacks[user_id]:
-                    user_contexts.append({
-                        "context_id": context_id,
-                        "context": contexts[user_id].get(context_id)
-                    })
-            
-            result = {"contexts": user_contexts}
+        result = await handler(parameters)
         
-        elif function_name == "get_context":
-            user_id = parameters.get("user_id")
-            context_id = parameters.get("context_id")
-            
-            if not user_id:
-                return {"error": "user_id parameter is required"}
-            
-            if not context_id:
-                return {"error": "context_id parameter is required"}
-            
-            # Check if user and context exist
-            if user_id not in contexts or context_id not in contexts[user_id]:
-                return {"error": f"Context with id {context_id} not found for user {user_id}", "success": False}
-            
-            # Get the context
-            context = contexts[user_id].get(context_id)
-            
-            result = {"context_id": context_id, "context": context, "success": True}
-        
-        elif function_name == "clear_contexts":
-            user_id = parameters.get("user_id")
-            
-            if not user_id:
-                return {"error": "user_id parameter is required"}
-            
-            # Clear user contexts
-            if user_id in contexts:
-                contexts[user_id] = {}
-                context_stacks[user_id] = []
-            
-            result = {"success": True}
-        
-        else:
-            return {"error": f"Function {function_name} not supported"}
-        
-        logger.info(f"Result: {result}")
-        return result
-    except json.JSONDecodeError:
+        if debug:
+            logger.debug("Result: %s", result)
+        return ORJSONResponse(result)
+    except orjson.JSONDecodeError:
         logger.error("Invalid JSON in request body")
-        return {"error": "Invalid JSON in request body"}
+        return ORJSONResponse({"error": "Invalid JSON in request body"})
     except Exception as e:
         logger.error(f"Error handling request: {str(e)}")
-        return {"error": str(e)}
+        return ORJSONResponse({"error": str(e)})
 
 @app.get("/")
 async def root():
     """Root endpoint that returns information about the server"""
-    return {
+    return ORJSONResponse({
         "name": "Context7 MCP Server",
         "version": "1.0.0",
         "description": "MCP server for context management operations",
         "functions": list(CONTEXT_FUNCTIONS.keys()),
         "documentation": "/openapi.json"
-    }
+    })
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"ok": True}
+    return ORJSONResponse({"ok": True})
 
-@lru_cache(maxsize=1)
 def get_openapi_schema_data():
-    """Generate OpenAPI schema for context management functions (cached)"""
+    """Generate OpenAPI schema for context management functions"""
     return {
         "openapi": "3.0.0",
         "info": {
@@ -326,17 +502,19 @@ def get_openapi_schema_data():
         }
     }
 
+# The schema is static, so serialize it once at import time
+_OPENAPI_BYTES = orjson.dumps(get_openapi_schema_data())
+_OPENAPI_BYTES_PRETTY = orjson.dumps(get_openapi_schema_data(), option=orjson.OPT_INDENT_2)
+
 @app.get("/openapi.json")
 async def get_openapi_schema(request: Request):
     """Return OpenAPI schema for context management functions"""
-    schema = get_openapi_schema_data()
-    
     # Check if client prefers text format
     accept_header = request.headers.get("accept", "")
     if "text/" in accept_header:
-        return Response(content=json.dumps(schema, indent=2), media_type="text/plain; charset=utf-8")
+        return Response(content=_OPENAPI_BYTES_PRETTY, media_type="text/plain")
     else:
-        return JSONResponse(content=schema, headers={"Content-Type": "application/json"})
+        return Response(content=_OPENAPI_BYTES, media_type="application/json")
 
 @app.get("/schema")
 async def get_schema(request: Request):
@@ -346,4 +524,12 @@ async def get_schema(request: Request):
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8000"))
     logger.info(f"Starting Context7 MCP Server on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "context7_server:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+        access_log=False
+    )
@@ -5,14 +5,15 @@ This file implements a relay server for the Context7 MCP server.
 """
 
 import os
-import json
 import logging
 from typing import Dict, Any, List, Optional
 
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
+import orjson
 import uvicorn
 
 # Configure logging
@@ -26,11 +27,35 @@ logger = logging.getLogger("context7-relay")
 UPSTREAM_URL = os.environ.get("UPSTREAM_URL", "https://context7-mcp.fly.dev")
 SERVICE_NAME = os.environ.get("SERVICE_NAME", "context7")
 
+# Connection-level headers that must not be relayed back to the client
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# Request headers not forwarded upstream; names in the ASGI scope are already lowercase.
+# Accept-Encoding is kept so the raw upstream body relayed back matches what the client accepts
+# (CLIENT defaults it to identity when none was sent), and Content-Length is kept so a
+# streamed body can be sent without chunked encoding.
+DROPPED_REQUEST_HEADERS = frozenset({
+    b"authorization",
+    b"host",
+    b"connection",
+    b"transfer-encoding",
+})
+
 # Create FastAPI app
 app = FastAPI(
     title="Context7 Relay",
     description="A relay server for the Context7 MCP server",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    # /openapi.json relays the upstream schema below;
+    # FastAPI's own schema, used by /docs and /redoc, moves aside instead of shadowing it
+    openapi_url="/fastapi-openapi.json"
 )
 
 # Add CORS middleware
@@ -42,6 +67,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared upstream client, created on startup so connections are pooled across requests
+CLIENT: Optional[httpx.AsyncClient] = None
+
+@app.on_event("startup")
+async def startup():
+    """Create the pooled upstream client"""
+    global CLIENT
+    # HTTP/2 lets concurrent proxied calls share one upstream connection
+    transport = httpx.AsyncHTTPTransport(
+        verify=httpx.create_ssl_context(),
+        http2=True,
+        retries=0,
+        limits=httpx.Limits(
+            max_connections=512,
+            max_keepalive_connections=128,
+            keepalive_expiry=60.0
+        )
+    )
+    CLIENT = httpx.AsyncClient(
+        base_url=UPSTREAM_URL,
+        transport=transport,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        # Overrides httpx's gzip/deflate default, which would relay compressed bodies to
+        # clients that never asked for them; a forwarded Accept-Encoding still takes precedence
+        headers={"Accept-Encoding": "identity"}
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the pooled upstream client"""
+    if CLIENT is not None:
+        await CLIENT.aclose()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -51,22 +109,29 @@ async def health_check():
 async def get_openapi_json():
     """Proxy the OpenAPI schema from the upstream server"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{UPSTREAM_URL}/openapi.json")
-            
-            # Add CORS headers
-            headers = dict(response.headers)
-            headers["Access-Control-Allow-Origin"] = "*"
-            headers["Access-Control-Allow-Credentials"] = "false"
-            
-            return JSONResponse(
-                content=response.json(),
-                status_code=response.status_code,
-                headers=headers
-            )
+        response = await CLIENT.get("/openapi.json")
+        
+        # Pass the upstream bytes through; Response sets its own Content-Length, and
+        # Content-Encoding is dropped since response.content is already decoded
+        headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key not in HOP_BY_HOP_HEADERS and key not in ("content-length", "content-encoding")
+        }
+        
+        # Add CORS headers
+        headers["Access-Control-Allow-Origin"] = "*"
+        headers["Access-Control-Allow-Credentials"] = "false"
+        
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers=headers,
+            media_type=response.headers.get("content-type", "application/json")
+        )
     except Exception as e:
         logger.error(f"Error fetching OpenAPI schema: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"Error fetching OpenAPI schema: {str(e)}"},
             status_code=500,
             headers={
@@ -84,58 +149,63 @@ async def get_schema():
 async def proxy(endpoint: str, request: Request):
     """Proxy requests to the upstream server"""
     try:
-        # Parse request body
-        body = await request.body()
-        
         # Log the request
-        logger.info(f"Received request for endpoint: {endpoint}")
-        if body:
-            try:
-                body_json = json.loads(body)
-                logger.info(f"Request body: {body_json}")
-            except json.JSONDecodeError:
-                logger.warning("Request body is not valid JSON")
+        logger.debug("Received request for endpoint: %s", endpoint)
         
-        # Prepare headers
-        headers = dict(request.headers)
+        # Stream the request body straight upstream; it is only buffered when it has to be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            body = await request.body()
+            if body:
+                try:
+                    logger.debug("Request body: %s", orjson.loads(body))
+                except orjson.JSONDecodeError:
+                    logger.warning("Request body is not valid JSON")
+        else:
+            body = request.stream()
         
-        # Strip Authorization header to avoid CORS issues
-        if "authorization" in headers:
-            del headers["authorization"]
-        if "Authorization" in headers:
-            del headers["Authorization"]
+        # Prepare headers, stripping Authorization (to avoid CORS issues) and hop-by-hop headers
+        headers = [
+            (key, value)
+            for key, value in request.headers.raw
+            if key not in DROPPED_REQUEST_HEADERS
+        ]
         
         # Forward the request to the upstream server
-        async with httpx.AsyncClient() as client:
-            upstream_url = f"{UPSTREAM_URL}/mcp/{endpoint}"
-            logger.info(f"Forwarding request to: {upstream_url}")
-            
-            response = await client.post(
-                upstream_url,
-                content=body,
-                headers=headers,
-                timeout=30.0
-            )
-            
-            # Log the response
-            logger.info(f"Received response with status code: {response.status_code}")
-            
-            # Return the response
-            content = response.content
-            response_headers = dict(response.headers)
-            
-            # Add CORS headers
-            response_headers["Access-Control-Allow-Origin"] = "*"
-            response_headers["Access-Control-Allow-Credentials"] = "false"
-            
-            return JSONResponse(
-                content=response.json() if content else {},
-                status_code=response.status_code,
-                headers=response_headers
-            )
+        upstream_url = f"/mcp/{endpoint}"
+        logger.debug("Forwarding request to: %s%s", UPSTREAM_URL, upstream_url)
+        
+        upstream_request = CLIENT.build_request(
+            "POST",
+            upstream_url,
+            content=body,
+            headers=headers
+        )
+        response = await CLIENT.send(upstream_request, stream=True)
+        
+        # Log the response
+        logger.debug("Received response with status code: %s", response.status_code)
+        
+        # Relay the upstream body as-is; the stream is closed once it has been sent
+        response_headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key not in HOP_BY_HOP_HEADERS
+        }
+        
+        # Add CORS headers
+        response_headers["Access-Control-Allow-Origin"] = "*"
+        response_headers["Access-Control-Allow-Credentials"] = "false"
+        
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers=response_headers,
+            media_type=response.headers.get("content-type", "application/json"),
+            background=BackgroundTask(response.aclose)
+        )
     except httpx.RequestError as e:
         logger.error(f"Error forwarding request: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"Error forwarding request: {str(e)}"},
             status_code=500,
             headers={
@@ -145,7 +215,7 @@ async def proxy(endpoint: str, request: Request):
         )
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"Unexpected error: {str(e)}"},
             status_code=500,
             headers={
@@ -154,24 +224,25 @@ async def proxy(endpoint: str, request: Request):
             }
         )
 
+# Headers for CORS preflight responses
+PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization",
+    "Access-Control-Allow-Credentials": "false",
+    "Access-Control-Max-Age": "86400"  # 24 hours
+}
+
+# Preflight response, built once and returned for every OPTIONS request
+_PREFLIGHT = Response(status_code=204, headers=PREFLIGHT_HEADERS)
+
 @app.options("/proxy/{endpoint:path}")
 async def options_proxy(endpoint: str):
     """Handle OPTIONS requests for CORS preflight"""
-    return JSONResponse(
-        content={},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "false",
-            "Access-Control-Max-Age": "86400"  # 24 hours
-        }
-    )
+    return _PREFLIGHT
 
-@app.get("/")
-async def root():
-    """Root endpoint that returns HTML documentation"""
-    html_content = """
+# Root documentation page, encoded once since it never changes
+_ROOT_HTML_BYTES = ("""
     <!DOCTYPE html>
     <html>
     <head>
@@ -246,11 +317,22 @@ async def root():
         </div>
     </body>
     </html>
-    """
-    
-    return HTMLResponse(content=html_content)
+    """).encode("utf-8")
+
+@app.get("/")
+async def root():
+    """Root endpoint that returns HTML documentation"""
+    return Response(content=_ROOT_HTML_BYTES, media_type="text/html")
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8080"))
     logger.info(f"Starting Context7 Relay on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "relay:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        access_log=False
+    )
@@ -5,15 +5,17 @@ This file implements a relay server for the Context7 MCP server.
 """
 
 import os
-import json
+import asyncio
+import base64
 import logging
-from functools import lru_cache
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional
 
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse
+from fastapi.responses import ORJSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
+import orjson
 import uvicorn
 
 # Configure logging
@@ -26,12 +28,52 @@ logger = logging.getLogger("context7-relay")
 # Get environment variables
 UPSTREAM_URL = os.environ.get("UPSTREAM_URL", "https://context7-mcp.fly.dev")
 SERVICE_NAME = os.environ.get("SERVICE_NAME", "context7")
+UPSTREAM_USERNAME = os.environ.get("UPSTREAM_USERNAME")
+UPSTREAM_PASSWORD = os.environ.get("UPSTREAM_PASSWORD")
+if not UPSTREAM_USERNAME or not UPSTREAM_PASSWORD:
+    raise RuntimeError("UPSTREAM_USERNAME and UPSTREAM_PASSWORD must be set")
+
+# Basic auth header for the upstream, encoded once rather than on every request
+UPSTREAM_AUTHORIZATION = "Basic " + base64.b64encode(
+    f"{UPSTREAM_USERNAME}:{UPSTREAM_PASSWORD}".encode("utf-8")
+).decode("ascii")
+
+# Request bodies larger than this are decoded in a worker thread, off the event loop
+OFFLOAD_PARSE_BYTES = 64 * 1024
+
+# Chunk size used when relaying upstream response bodies
+STREAM_CHUNK_BYTES = 32 * 1024
+
+# Connection-level headers that must not be relayed back to the client
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# Request headers not forwarded upstream; names in the ASGI scope are already lowercase.
+# Host is left to httpx so it matches UPSTREAM_URL; Content-Length is kept so a streamed
+# body is sent without chunked encoding. The client's Accept-Encoding is forwarded so the
+# raw upstream body relayed back is one the client can decode.
+DROPPED_REQUEST_HEADERS = frozenset({
+    b"authorization",
+    b"host",
+    b"connection",
+    b"transfer-encoding",
+})
 
 # Create FastAPI app
 app = FastAPI(
     title="Context7 Relay",
     description="A relay server for the Context7 MCP server",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    # The schema is served from precomputed bytes by the routes below
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None
 )
 
 # Add CORS middleware
@@ -43,6 +85,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared upstream client, created on startup so connections are pooled across requests.
+# Each worker process builds its own client and pool.
+CLIENT: Optional[httpx.AsyncClient] = None
+
+# Serialized OpenAPI schema (JSON and indented text), built on startup once every route is registered
+OPENAPI_BYTES = b""
+OPENAPI_TXT = b""
+
+@app.on_event("startup")
+async def startup():
+    """Create the pooled upstream client and serialize the OpenAPI schema"""
+    global CLIENT, OPENAPI_BYTES, OPENAPI_TXT
+    OPENAPI_BYTES = orjson.dumps(app.openapi())
+    OPENAPI_TXT = orjson.dumps(app.openapi(), option=orjson.OPT_INDENT_2)
+    CLIENT = httpx.AsyncClient(
+        base_url=UPSTREAM_URL.rstrip("/"),
+        http2=True,
+        timeout=30.0,
+        # Request identity when the client sent no Accept-Encoding; otherwise httpx's
+        # gzip/deflate default would have compressed bodies relayed to clients that never asked
+        headers={"Authorization": UPSTREAM_AUTHORIZATION, "Accept-Encoding": "identity"},
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the pooled upstream client"""
+    if CLIENT is not None:
+        await CLIENT.aclose()
+
 # Define OpenAPI schema for context management functions
 CONTEXT_FUNCTIONS = {
     "push_context": {
@@ -147,117 +219,120 @@ CONTEXT_FUNCTIONS = {
     }
 }
 
+# Health check body, encoded once for load balancer probes
+HEALTH_BODY = b'{"ok":true}'
+_HEALTH = Response(content=HEALTH_BODY, media_type="application/json")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"ok": True}
+    return _HEALTH
 
 @app.get("/openapi.json")
 async def get_openapi_json():
     """Return OpenAPI schema in JSON format"""
-    return JSONResponse(
-        content=app.openapi(),
-        media_type="application/json"
-    )
+    return Response(content=OPENAPI_BYTES, media_type="application/json")
 
 @app.get("/openapi.txt", response_class=PlainTextResponse)
-@lru_cache(maxsize=1)
-def openapi_txt():
+async def openapi_txt():
     """Return OpenAPI schema in plain text format"""
-    return json.dumps(app.openapi(), indent=2)
+    return Response(content=OPENAPI_TXT, media_type="text/plain")
 
 @app.post("/proxy/{endpoint:path}")
 async def proxy(endpoint: str, request: Request):
     """Proxy requests to the upstream server"""
     try:
-        # Parse request body
-        body = await request.body()
-        
         # Log the request
-        logger.info(f"Received request for endpoint: {endpoint}")
-        if body:
-            try:
-                body_json = json.loads(body)
-                logger.info(f"Request body: {body_json}")
-            except json.JSONDecodeError:
-                logger.warning("Request body is not valid JSON")
+        logger.info("Received request for endpoint: %s", endpoint)
         
-        # Prepare headers
-        headers = dict(request.headers)
+        # Stream the request body straight upstream; it is only buffered when it has to be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            body = await request.body()
+            if body:
+                try:
+                    if len(body) > OFFLOAD_PARSE_BYTES:
+                        body_json = await asyncio.get_running_loop().run_in_executor(None, orjson.loads, body)
+                    else:
+                        body_json = orjson.loads(body)
+                    logger.debug("Request body: %s", body_json)
+                except orjson.JSONDecodeError:
+                    logger.warning("Request body is not valid JSON")
+        else:
+            body = request.stream()
         
-        # Strip Authorization header to avoid CORS issues
-        if "authorization" in headers:
-            del headers["authorization"]
-        if "Authorization" in headers:
-            del headers["Authorization"]
+        # Prepare headers, stripping Authorization (to avoid CORS issues) and hop-by-hop headers
+        headers = [
+            (key, value)
+            for key, value in request.headers.raw
+            if key not in DROPPED_REQUEST_HEADERS
+        ]
         
-        # Forward the request to the upstream server
-        async with httpx.AsyncClient() as client:
-            upstream_url = f"{UPSTREAM_URL}/mcp/{endpoint}"
-            logger.info(f"Forwarding request to: {upstream_url}")
-            
-            response = await client.post(
-                upstream_url,
-                content=body,
-                headers=headers,
-                auth=("instabids", "secure123password"),
-                timeout=30.0
-            )
-            
-            # Log the response
-            logger.info(f"Received response with status code: {response.status_code}")
-            
-            # Return the response
-            content = response.content
-            response_headers = dict(response.headers)
-            
-            # Add CORS headers
-            response_headers["Access-Control-Allow-Origin"] = "*"
-            response_headers["Access-Control-Allow-Credentials"] = "false"
+        # Forward the request to the upstream server. The endpoint is always appended to
+        # the fixed /mcp/ prefix so it stays a relative path; passed on its own, an
+        # absolute URL such as http://host/... would override the client's base URL.
+        upstream_request = CLIENT.build_request(
+            "POST",
+            "/mcp/" + endpoint,
+            content=body,
+            headers=headers
+        )
+        logger.debug("Forwarding request to: %s", upstream_request.url)
+        response = await CLIENT.send(upstream_request, stream=True)
+        
+        # Log the response
+        logger.info("Received response with status code: %s", response.status_code)
+        
+        # Relay the raw upstream body as it arrives; the stream is closed once it has been sent
+        try:
+            response_headers = {
+                key: value
+                for key, value in response.headers.items()
+                if key not in HOP_BY_HOP_HEADERS
+            }
             
-            return JSONResponse(
-                content=response.json() if content else {},
+            return StreamingResponse(
+                response.aiter_raw(STREAM_CHUNK_BYTES),
                 status_code=response.status_code,
-                headers=response_headers
+                media_type=response.headers.get("content-type", "application/json"),
+                headers=response_headers,
+                background=BackgroundTask(response.aclose)
             )
+        except Exception:
+            # Nothing will consume the stream, so release the upstream connection now
+            await response.aclose()
+            raise
     except httpx.RequestError as e:
         logger.error(f"Error forwarding request: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"Error forwarding request: {str(e)}"},
-            status_code=500,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Credentials": "false"
-            }
+            status_code=500
         )
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"Unexpected error: {str(e)}"},
-            status_code=500,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Credentials": "false"
-            }
+            status_code=500
         )
 
-@app.options("/proxy/{endpoint:path}")
-async def options_proxy(endpoint: str):
-    """Handle OPTIONS requests for CORS preflight"""
-    return JSONResponse(
-        content={},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "false",
-            "Access-Control-Max-Age": "86400"  # 24 hours
-        }
-    )
+def _render_function(function_name: str, function_info: Dict[str, Any]) -> str:
+    """Render the documentation fragment for a single context function"""
+    return f"""
+        <div class="endpoint">
+            <h3>{function_name}</h3>
+            <p class="description">{function_info["description"]}</p>
+            <pre>curl -X POST https://context7-relay.fly.dev/proxy/{function_name} \\
+    -H "Content-Type: application/json" \\
+    -d '{orjson.dumps(function_info["example"]).decode()}'</pre>
+        </div>
+        """
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    """Root endpoint that returns HTML documentation"""
+# Function fragments for the documentation page, rendered once from CONTEXT_FUNCTIONS
+_FUNCTION_FRAGMENTS = "".join(
+    _render_function(name, info) for name, info in CONTEXT_FUNCTIONS.items()
+)
+
+def _build_root_html() -> str:
+    """Build the HTML documentation page"""
     html_content = """
     <!DOCTYPE html>
     <html>
@@ -294,26 +369,32 @@ async def root():
         <h2>Available Functions</h2>
     """
     
-    for function_name, function_info in CONTEXT_FUNCTIONS.items():
-        example = json.dumps(function_info["example"], indent=4)
-        html_content += f"""
-        <div class="endpoint">
-            <h3>{function_name}</h3>
-            <p class="description">{function_info["description"]}</p>
-            <pre>curl -X POST https://context7-relay.fly.dev/proxy/{function_name} \\
-    -H "Content-Type: application/json" \\
-    -d '{json.dumps(function_info["example"])}'</pre>
-        </div>
-        """
-    
+    html_content += _FUNCTION_FRAGMENTS
     html_content += """
     </body>
     </html>
     """
     
-    return HTMLResponse(content=html_content, media_type="text/html")
+    return html_content
+
+# The documentation page only depends on constants, so render it once at import
+ROOT_HTML = _build_root_html().encode("utf-8")
+
+@app.get("/", response_class=HTMLResponse)
+async def root():
+    """Root endpoint that returns HTML documentation"""
+    return HTMLResponse(content=ROOT_HTML)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8080"))
     logger.info(f"Starting Context7 Relay on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "relay:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        log_level="warning",
+        access_log=False
+    )